@@ -5,9 +5,15 @@ import os
 import re
 import csv
 import copy
+import gzip
+import json
+import multiprocessing
 import urllib
+from cStringIO import StringIO
 
 from dateutil.parser import parse as dateparse
+import requests
+from requests.adapters import HTTPAdapter
 from simple_salesforce import Salesforce
 
 from vlib import conf
@@ -19,7 +25,7 @@ VERBOSE = 0
 IND_PROGRESS_INTERVAL = 50
 
 COMMANDS = ('create', 'delete', 'deleted', 'desc', 'fields', 'query', 'queryAll',
-            'show', 'update')
+            'show', 'tree', 'update', 'validate')
 SFOBJECTS = ('Account', 'Adoption', 'Book', 'CampaignMember', 'Campaign',
              'Case', 'Contact', 'Lead', 'Opportunity',
              'OpportunityContactRole', 'User', 'Task', 'Desk_Copy')
@@ -27,6 +33,28 @@ CUSTOMOBJECTS = ('Adoption', 'Book', 'Desk_Copy')
 
 RECORD_KEYS_TO_IGNORE = ['attributes']
 
+# HTTP connection defaults, overridden by salesforce: http: in conf
+HTTP_DEFAULTS = {'compress': True,
+                 'compress_min_size': 1024,
+                 'keep_alive': True,
+                 'max_retries': 0,
+                 'pool_connections': 10,
+                 'pool_maxsize': 10,
+                 'timeout': 120}
+REST_PATH = '/services/data/'
+
+# Offline pre-validation
+VALIDATE_CHUNK_SIZE = 50000
+ID_REGEX = re.compile('^[a-zA-Z0-9]{15}([a-zA-Z0-9]{3})?$')
+NUMERIC_TYPES = ('currency', 'double', 'percent')
+TEXT_TYPES = ('email', 'encryptedstring', 'multipicklist', 'phone',
+              'picklist', 'string', 'textarea', 'url')
+
+# Composite sObject Tree API
+TREE_MAX_NODES = 200
+TREE_REF_COLUMN = 'Ref'
+TREE_PARENT_REF_COLUMN = 'ParentRef'
+
 class SalesforceApiError(Exception): pass
 class SalesforceApiParameterError(SalesforceApiError): pass
 class SalesforceApiFieldLenMismatch(SalesforceApiError): pass
@@ -90,6 +118,41 @@ class SalesforceApi(object):
                 return self.create(sfobject, header, rows)
             else:
                 return self.update(sfobject, header, rows)
+        elif command == 'validate':
+            action = 'update'
+            if args and args[0] in ('create', 'delete', 'update'):
+                action = args[0]
+                args = args[1:]
+            validate_num_args('validate', 2, args)
+            sfobject = self.validate('sfobject', args[0])
+            csvfile  = self.validate('csvfile',  args[1])
+            header, rows = self.loadCsv(csvfile)
+            return self.validateCsv(sfobject, header, rows, action,
+                                    processes=None)
+        elif command == 'tree':
+            if len(args) < 3:
+                raise SalesforceApiParameterError(
+                    'tree: requires <object> <csvfile> '
+                    '<childobject>[.<relationship>]:<csvfile> ...')
+            sfobject = self.validate('sfobject', args[0])
+            csvfile  = self.validate('csvfile',  args[1])
+            header, rows = self.loadCsv(csvfile)
+            children = []
+            for child in args[2:]:
+                if ':' not in child:
+                    raise SalesforceApiParameterError(
+                        'Child must be <childobject>[.<relationship>]:'
+                        '<csvfile>: %s' % child)
+                child_sfobject, child_csvfile = child.split(':', 1)
+                relationship = None
+                if '.' in child_sfobject:
+                    child_sfobject, relationship = child_sfobject.split('.', 1)
+                child_sfobject = self.validate('sfobject', child_sfobject)
+                child_csvfile  = self.validate('csvfile',  child_csvfile)
+                child_header, child_rows = self.loadCsv(child_csvfile)
+                children.append((child_sfobject, child_header, child_rows,
+                                 relationship))
+            return self.tree(sfobject, header, rows, children)
         elif command == 'deleted':
             validate_num_args('deleted', 3, args)
             sfobject = args[0]
@@ -112,9 +175,24 @@ class SalesforceApi(object):
             token     = self.conf['salesforce']['token']
             self._connection = Salesforce(username=user,
                                           password=password,
-                                          security_token=token)
+                                          security_token=token,
+                                          session=self.httpSession())
         return self._connection
 
+    def httpSession(self):
+        '''Return a SalesforceSession configured from
+           the optional salesforce: http: section of conf.
+           See HTTP_DEFAULTS
+        '''
+        options = self.conf['salesforce'].get('http') or {}
+        unknown = sorted(set(options) - set(HTTP_DEFAULTS))
+        if unknown:
+            raise SalesforceApiParameterError(
+                'Unrecognized salesforce: http: option(s): %s. '
+                'Must be one of: %s' % (', '.join(unknown),
+                                        ', '.join(sorted(HTTP_DEFAULTS))))
+        return SalesforceSession(**options)
+
     @property
     def connection2(self):
         '''Behavior: Log in to Salesforce
@@ -172,7 +250,17 @@ class SalesforceApi(object):
             results[key] = {'type': field['type'],
                             'length': field['length'],
                             'name': field['name'],
-                            'position': i+1}
+                            'position': i+1,
+                            'nillable': field.get('nillable', True),
+                            'defaultedOnCreate':
+                                field.get('defaultedOnCreate', False),
+                            'createable': field.get('createable', True),
+                            'restrictedPicklist':
+                                field.get('restrictedPicklist', False),
+                            'picklistValues':
+                                [p['value']
+                                 for p in field.get('picklistValues') or []
+                                 if p.get('active', True)]}
         return results
 
     def deleted(self, sfobject, from_date, to_date):
@@ -293,7 +381,8 @@ class SalesforceApi(object):
         '''Delete Records. Calls update()'''
         return self.update(sfobject, header, rows, action='delete')
 
-    def update(self, sfobject, header, rows, action='update'):
+    def update(self, sfobject, header, rows, action='update', preflight=True,
+               processes=None):
         '''Given: sfobject as a STR, 
                   header   as an ARRAY, and
                   rows     as an ARRAY of Arrays
@@ -304,6 +393,12 @@ class SalesforceApi(object):
                      Header names much match Salesforce Object field names.
                      First column must be the Id column.
 
+                     If preflight, rows are first checked offline with
+                     validateRows(), and rejects are written to the
+                     failure file without being sent.  Inputs over
+                     VALIDATE_CHUNK_SIZE rows are checked in parallel by
+                     processes workers (None for one per CPU, 1 for none).
+
            Returns:  Message as an Array of 
                      Number of successes and failures
                      And the names of the output files.
@@ -322,6 +417,12 @@ class SalesforceApi(object):
         obj    = sf.__getattr__(sfobject.title())
         fields = self.fields(sfobject)
 
+        # offline pre-validation:
+        if preflight:
+            rows, failures = self.validateRows(sfobject, header, rows,
+                                               action, fields,
+                                               processes=processes)
+
         # process rows:
         rcnt = 0
         data = {}
@@ -338,23 +439,9 @@ class SalesforceApi(object):
                 field = header[i]
                 key = field.lower()
 
-                # validate field:
-                if key not in fields.keys():
-                    raise SalesforceApiError(
-                        "Invalid column '%s' for Salesforce object: %s"
-                        % (field, sfobject))
-
-                # spec. handling by field types:
-                if fields[key]['type'] == 'double':
-                    if not value:
-                        continue
-                elif fields[key]['type'] == 'date':
-                    if not value:
-                        continue
-                    value=format_datetime(dateparse(value),format='ISO8601')
-                elif fields[key]['type'] in ('string'):
-                    if value:
-                        value = unicode(value, errors='ignore')
+                value = self.formatValue(sfobject, fields, field, value)
+                if value is None:
+                    continue
 
                 # Set value:
                 data[field] = value
@@ -384,25 +471,441 @@ class SalesforceApi(object):
                     % (rcnt, len(successes), len(failures))
 
         # write output files:
+        results += self.writeOutput(sfobject, header, successes, failures)
+        return results
+
+    def formatValue(self, sfobject, fields, field, value):
+        '''Given: sfobject as a STR,
+                  fields   as returned by fields(),
+                  field    a column name, and
+                  value    a STR from the csv file
+
+           Return value formatted for the Salesforce field type,
+                  or None if the value should not be sent
+        '''
+        key = field.lower()
+
+        # validate field:
+        if key not in fields.keys():
+            raise SalesforceApiError(
+                "Invalid column '%s' for Salesforce object: %s"
+                % (field, sfobject))
+
+        # spec. handling by field types:
+        if fields[key]['type'] == 'double':
+            if not value:
+                return None
+        elif fields[key]['type'] == 'date':
+            if not value:
+                return None
+            value = format_datetime(dateparse(value), format='ISO8601')
+        elif fields[key]['type'] in ('string'):
+            if value:
+                value = unicode(value, errors='ignore')
+        return value
+
+    def writeOutput(self, sfobject, header, successes, failures,
+                    success_columns=None):
+        '''Write success and failure csv output files
+           Return Message as an Array of
+                  Number of successes and failures
+                  And the names of the output files.
+        '''
+        if success_columns is None:
+            success_columns = ['Status']
         failure_msg = '%6s failures ' % len(failures)
         if failures:
-            failure_file = 'failure_%s_%s.csv' % (sfobject, uniqueId())
-            writer = csv.writer(open(failure_file, 'w'))
-            writer.writerow(header + ['Failure'])
-            writer.writerows(failures)
+            failure_file = self.writeCsv('failure', sfobject,
+                                         header + ['Failure'], failures)
             failure_msg += ' (%s)' % failure_file
 
         success_msg = '%6s successes' % len(successes)
         if successes:
-            success_file = 'success_%s_%s.csv' % (sfobject, uniqueId())
-            writer = csv.writer(open(success_file, 'w'))
-            writer.writerow(header + ['Status'])
-            writer.writerows(successes)
+            success_file = self.writeCsv('success', sfobject,
+                                         header + success_columns, successes)
             success_msg += ' (%s)' % success_file
 
-        results += [success_msg, failure_msg]
+        return [success_msg, failure_msg]
+
+    def writeCsv(self, prefix, sfobject, header, rows):
+        '''Write header and rows to a uniquely named csv file
+           Return the file name
+        '''
+        filename = '%s_%s_%s.csv' % (prefix, sfobject, uniqueId())
+        writer = csv.writer(open(filename, 'w'))
+        writer.writerow(header)
+        writer.writerows(rows)
+        return filename
+
+    def validateCsv(self, sfobject, header, rows, action='update',
+                    processes=1):
+        '''Check rows offline against fields() metadata,
+           as they would be sent by action (create, update or delete).
+           No API calls are made beyond the describe.
+           See validateRows() for processes.
+
+           Creates a failure csv output file of rejected rows.
+
+           Returns:  Message as an Array of
+                     Number of valid and rejected rows
+                     And the name of the output file.
+        '''
+        valid, rejects = self.validateRows(sfobject, header, rows, action,
+                                           processes=processes)
+        reject_msg = '%6s rejects' % len(rejects)
+        if rejects:
+            reject_file = self.writeCsv('failure', sfobject,
+                                        header + ['Failure'], rejects)
+            reject_msg += ' (%s)' % reject_file
+        return ['%6s valid' % len(valid), reject_msg]
+
+    def validateRows(self, sfobject, header, rows, action='update',
+                     fields=None, ignore=None, processes=1):
+        '''Given: sfobject as a STR,
+                  header   as an ARRAY, and
+                  rows     as an ARRAY of Arrays
+
+           Check every row against fields() metadata: Id format,
+           length, type, required fields and restricted picklist values.
+           Columns named in ignore are not checked.
+
+           Rows are checked in this process by default.  If processes
+           is not 1, inputs over VALIDATE_CHUNK_SIZE rows are checked in
+           chunks by a multiprocessing Pool of that many workers
+           (None for one per CPU).
+
+           Returns:  a tuple: (valid   rows an ARRAY of ARRAYS, and
+                               rejects rows an ARRAY of ARRAYS with
+                                       the failure message appended)
+        '''
+        if fields is None:
+            fields = self.fields(sfobject)
+
+        # validate header:
+        ignore = [c.lower() for c in ignore or []]
+        for field in header:
+            if field.lower() not in fields and field.lower() not in ignore:
+                raise SalesforceApiError(
+                    "Invalid column '%s' for Salesforce object: %s"
+                    % (field, sfobject))
+
+        # required fields missing from header reject every row:
+        missing = []
+        if action == 'create':
+            names = [h.lower() for h in header]
+            missing = [f['name'] for k, f in sorted(fields.items())
+                       if required_field(f, action) and k not in names]
+        if missing:
+            emsg = 'Required fields missing: %s' % ', '.join(missing)
+            return [], [row + [emsg] for row in rows]
+
+        columns = [fields.get(h.lower()) if h.lower() not in ignore else None
+                   for h in header]
+        chunks = [(columns, rows[i:i+VALIDATE_CHUNK_SIZE], action)
+                  for i in range(0, len(rows), VALIDATE_CHUNK_SIZE)]
+        if len(chunks) > 1 and processes != 1:
+            pool = multiprocessing.Pool(processes)
+            try:
+                chunk_results = pool.map(validate_chunk, chunks)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            chunk_results = map(validate_chunk, chunks)
+
+        valid = []
+        rejects = []
+        for chunk_valid, chunk_rejects in chunk_results:
+            valid += chunk_valid
+            rejects += chunk_rejects
+        return valid, rejects
+
+    def childRelationships(self, sfobject):
+        '''Return a DICT of child object name (lowercase)
+           to a LIST of named child relationship describe data of sfobject.
+           eg. {'contact': [{'relationshipName': 'Contacts',
+                             'field': 'AccountId', ...}], ...}
+        '''
+        sf = self.connection
+        result = sf.__getattr__(sfobject).describe()
+        results = {}
+        for relationship in result['childRelationships']:
+            key = relationship['childSObject'].lower()
+            if relationship['relationshipName']:
+                results.setdefault(key, []).append(relationship)
         return results
 
+    def childRelationship(self, relationships, sfobject, child_sfobject,
+                          name=None):
+        '''Given relationships as returned by childRelationships()
+           Return the one relationship between sfobject and child_sfobject,
+           or the one called name if given
+        '''
+        candidates = relationships.get(child_sfobject.lower(), [])
+        if not candidates:
+            raise SalesforceApiError('%s is not a child object of %s'
+                                     % (child_sfobject, sfobject))
+        if name:
+            candidates = [r for r in candidates
+                          if r['relationshipName'].lower() == name.lower()]
+            if not candidates:
+                raise SalesforceApiError(
+                    'No relationship %s from %s to %s'
+                    % (name, sfobject, child_sfobject))
+        if len(candidates) > 1:
+            raise SalesforceApiError(
+                '%s has more than one relationship to %s: %s. '
+                'Name one as <childobject>.<relationship>'
+                % (child_sfobject, sfobject,
+                   ', '.join([r['relationshipName'] for r in candidates])))
+        return candidates[0]
+
+    def tree(self, sfobject, header, rows, children):
+        '''Given: sfobject as a STR,
+                  header   as an ARRAY,
+                  rows     as an ARRAY of Arrays, and
+                  children as an ARRAY of (child_sfobject, child_header,
+                                           child_rows[, relationship])
+                           tuples.  relationship, the child relationship
+                           name, is needed only when child_sfobject has
+                           more than one relationship to sfobject.
+
+           Behavior: Create parent records with their child records
+                     using the Composite sObject Tree API, in batches of
+                     up to TREE_MAX_NODES records per request.
+                     creates success and failure csv output files
+                     per object.  Success files include the new Id,
+                     and child success files the new parent Id.
+
+                     Parent header must include a TREE_REF_COLUMN column,
+                     a local key unique to each parent row.
+                     Child headers must include a TREE_PARENT_REF_COLUMN
+                     column, naming the parent row's local key.
+                     Neither column is sent to Salesforce.
+                     Rows with a blank key are rejected.
+
+                     Rows are first checked offline with validateRows().
+                     Rejects, and children of rejected parents, are
+                     written to the failure files without being sent.
+
+                     A batch is all or nothing: if any record fails,
+                     no record in the batch is created.
+
+           Returns:  Message as an Array of
+                     Number of successes and failures per object
+                     And the names of the output files.
+        '''
+        # output files are per object, or per object and relationship
+        # when an object is the parent or more than one child:
+        relationships = self.childRelationships(sfobject)
+        keys = [sfobject]
+        headers = {sfobject: header}
+        child_specs = []
+        for child in children:
+            child_sfobject, child_header, child_rows = child[:3]
+            name = child[3] if len(child) > 3 else None
+            relationship = self.childRelationship(relationships, sfobject,
+                                                  child_sfobject, name)
+            key = child_sfobject
+            if key in keys:
+                key = '%s.%s' % (child_sfobject,
+                                 relationship['relationshipName'])
+            keys.append(key)
+            headers[key] = child_header
+            child_specs.append((key, child_sfobject, child_header,
+                                child_rows, relationship))
+        successes = dict([(k, []) for k in keys])
+        failures  = dict([(k, []) for k in keys])
+
+        # check parent keys:
+        ref_idx = column_index(header, TREE_REF_COLUMN, sfobject)
+        refs = [row[ref_idx] for row in rows if row[ref_idx]]
+        for ref in refs:
+            if refs.count(ref) > 1:
+                raise SalesforceApiError(
+                    'Duplicate %s value for %s: %s'
+                    % (TREE_REF_COLUMN, sfobject, ref))
+        failures[sfobject] += [row + ['Missing %s' % TREE_REF_COLUMN]
+                               for row in rows if not row[ref_idx]]
+        rows = [row for row in rows if row[ref_idx]]
+
+        # build parent nodes:
+        fields = self.fields(sfobject)
+        rows, rejects = self.validateRows(sfobject, header, rows, 'create',
+                                          fields, ignore=[TREE_REF_COLUMN],
+                                          processes=None)
+        failures[sfobject] += rejects
+        rejected_refs = set([row[ref_idx] for row in rejects])
+        nodes = []
+        nodes_by_ref = {}
+        for row in rows:
+            node = {'key': sfobject,
+                    'sfobject': sfobject,
+                    'row': row,
+                    'record': self.treeRecord(sfobject, fields, header, row,
+                                              [ref_idx]),
+                    'children': {}}
+            nodes.append(node)
+            nodes_by_ref[row[ref_idx]] = node
+
+        # attach child records to their parents:
+        for key, child_sfobject, child_header, child_rows, relationship \
+                in child_specs:
+            parent_idx = column_index(child_header, TREE_PARENT_REF_COLUMN,
+                                      child_sfobject)
+            skip = [parent_idx]
+            if TREE_REF_COLUMN.lower() in [h.lower() for h in child_header]:
+                skip.append(column_index(child_header, TREE_REF_COLUMN,
+                                         child_sfobject))
+            child_fields = self.fields(child_sfobject)
+
+            # the Tree API sets the parent lookup field itself:
+            vfields = dict(child_fields)
+            lookup = relationship['field'].lower()
+            if lookup in vfields:
+                vfields[lookup] = dict(vfields[lookup], nillable=True)
+            failures[key] += [row + ['Missing %s' % TREE_PARENT_REF_COLUMN]
+                              for row in child_rows if not row[parent_idx]]
+            child_rows = [row for row in child_rows if row[parent_idx]]
+            child_rows, rejects = self.validateRows(
+                child_sfobject, child_header, child_rows, 'create', vfields,
+                ignore=[TREE_REF_COLUMN, TREE_PARENT_REF_COLUMN],
+                processes=None)
+            failures[key] += rejects
+
+            for row in child_rows:
+                parent = nodes_by_ref.get(row[parent_idx])
+                if row[parent_idx] in rejected_refs:
+                    failures[key].append(
+                        row + ['Parent rejected: %s' % row[parent_idx]])
+                    continue
+                if not parent:
+                    failures[key].append(
+                        row + ['Unknown %s: %s'
+                               % (TREE_PARENT_REF_COLUMN, row[parent_idx])])
+                    continue
+                child = {'key': key,
+                         'sfobject': child_sfobject,
+                         'row': row,
+                         'record': self.treeRecord(child_sfobject,
+                                                   child_fields, child_header,
+                                                   row, skip)}
+                parent['children'].setdefault(
+                    relationship['relationshipName'], []).append(child)
+
+        # submit in batches:
+        batch = []
+        batch_size = 0
+        for node in nodes:
+            size = 1 + sum([len(c) for c in node['children'].values()])
+            if size > TREE_MAX_NODES:
+                emsg = 'Tree of %s records exceeds limit of %s' \
+                       % (size, TREE_MAX_NODES)
+                for n in [node] + sum(node['children'].values(), []):
+                    failures[n['key']].append(n['row'] + [emsg])
+                continue
+            if batch and batch_size + size > TREE_MAX_NODES:
+                self.treeSubmit(sfobject, batch, successes, failures)
+                batch = []
+                batch_size = 0
+            batch.append(node)
+            batch_size += size
+        if batch:
+            self.treeSubmit(sfobject, batch, successes, failures)
+
+        # write output files:
+        results = []
+        for i, key in enumerate(keys):
+            if i == 0:
+                success_columns = ['Id', 'Status']
+            else:
+                success_columns = ['Id', 'ParentId', 'Status']
+            results.append('%s:' % key)
+            results += self.writeOutput(key, headers[key], successes[key],
+                                        failures[key], success_columns)
+        return results
+
+    def treeRecord(self, sfobject, fields, header, row, skip):
+        '''Return a DICT of field values of row for the Tree API,
+           leaving out the column indexes in skip
+        '''
+        record = {}
+        for i, value in enumerate(row):
+            if i in skip:
+                continue
+            value = self.formatValue(sfobject, fields, header[i], value)
+            if value is None:
+                continue
+            record[header[i]] = value
+        return record
+
+    def treeSubmit(self, sfobject, batch, successes, failures):
+        '''Post one batch of parent nodes to the Composite sObject Tree API
+           Append results to successes and failures DICTs of ARRAYS
+           keyed by sfobject
+        '''
+        sf = self.connection
+
+        # build request, assigning referenceIds:
+        refs = {}
+        parent_refs = {}
+        records = []
+        for node in batch:
+            ref = 'ref%s' % (len(refs) + 1)
+            refs[ref] = node
+            record = dict(node['record'])
+            record['attributes'] = {'type': node['sfobject'],
+                                    'referenceId': ref}
+            for relationship, children in node['children'].items():
+                child_records = []
+                for child in children:
+                    child_ref = 'ref%s' % (len(refs) + 1)
+                    refs[child_ref] = child
+                    parent_refs[child_ref] = ref
+                    child_record = dict(child['record'])
+                    child_record['attributes'] = {'type': child['sfobject'],
+                                                  'referenceId': child_ref}
+                    child_records.append(child_record)
+                record[relationship] = {'records': child_records}
+            records.append(record)
+
+        if self.verbose:
+            print 'Submitting tree of %s records' % len(refs)
+
+        emsg = None
+        try:
+            result = sf.restful('composite/tree/%s' % sfobject,
+                                method='POST',
+                                data=json.dumps({'records': records}))
+        except Exception, e:
+            # Tree API errors come back as a 400 with per record results
+            result = getattr(e, 'content', None)
+            if not isinstance(result, dict):
+                emsg = '%s. %s' % (e.__class__.__name__, e)
+                result = {'hasErrors': True, 'results': []}
+
+        if not result.get('hasErrors'):
+            ids = dict([(r['referenceId'], r['id'])
+                        for r in result['results']])
+            status = past_tense_action_str('create')
+            for ref in sorted(refs, key=lambda r: int(r[3:])):
+                node = refs[ref]
+                if ref in parent_refs:
+                    row = node['row'] + [ids[ref], ids[parent_refs[ref]],
+                                         status]
+                else:
+                    row = node['row'] + [ids[ref], status]
+                successes[node['key']].append(row)
+        else:
+            errors = {}
+            for r in result['results']:
+                errors[r['referenceId']] = '. '.join(
+                    [e['message'] for e in r.get('errors', [])])
+            for ref in sorted(refs, key=lambda r: int(r[3:])):
+                node = refs[ref]
+                failures[node['key']].append(
+                    node['row'] + [errors.get(ref, emsg or 'Rolled back')])
+
     def loadCsv(self, csvfile):
         '''Given a csv filename
            Return a tuple: (header an ARRAY, and
@@ -465,6 +968,169 @@ class SalesforceApi(object):
 
         return value
 
+class SalesforceSession(requests.Session):
+    '''requests Session tuned for the Salesforce REST API
+
+       Sends gzip compressed REST request bodies, and applies pool
+       sizes, retries, keep-alive and a default timeout.
+
+       Response compression needs nothing here: requests already sends
+       Accept-Encoding: gzip, deflate and decompresses as it streams.
+    '''
+
+    def __init__(self, compress=HTTP_DEFAULTS['compress'],
+                 compress_min_size=HTTP_DEFAULTS['compress_min_size'],
+                 keep_alive=HTTP_DEFAULTS['keep_alive'],
+                 max_retries=HTTP_DEFAULTS['max_retries'],
+                 pool_connections=HTTP_DEFAULTS['pool_connections'],
+                 pool_maxsize=HTTP_DEFAULTS['pool_maxsize'],
+                 timeout=HTTP_DEFAULTS['timeout']):
+        super(SalesforceSession, self).__init__()
+        self.compress = compress
+        self.compress_min_size = compress_min_size
+        self.timeout = timeout
+
+        adapter = HTTPAdapter(pool_connections=pool_connections,
+                              pool_maxsize=pool_maxsize,
+                              max_retries=max_retries)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+
+        if not keep_alive:
+            self.headers['Connection'] = 'close'
+
+    def request(self, method, url, **kwargs):
+        if self.timeout:
+            kwargs.setdefault('timeout', self.timeout)
+
+        # compress REST request bodies. Login (SOAP) is left as is:
+        data = kwargs.get('data')
+        if self.compress and REST_PATH in url \
+           and isinstance(data, basestring) \
+           and len(data) >= self.compress_min_size:
+            headers = dict(kwargs.get('headers') or {})
+            headers['Content-Encoding'] = 'gzip'
+            kwargs['headers'] = headers
+            kwargs['data'] = gzip_str(data)
+
+        return super(SalesforceSession, self).request(method, url, **kwargs)
+
+def gzip_str(data):
+    '''Return STR data gzip compressed'''
+    if isinstance(data, unicode):
+        data = data.encode('utf-8')
+    buf = StringIO()
+    fp = gzip.GzipFile(fileobj=buf, mode='wb')
+    fp.write(data)
+    fp.close()
+    return buf.getvalue()
+
+def required_field(field, action='create'):
+    '''Return True if field must have a value for action
+
+       On update, empty double and date values are not sent
+       (see SalesforceApi.formatValue), so they are not required
+    '''
+    if field['nillable'] or field['type'] == 'boolean':
+        return False
+    if action == 'create':
+        return field['createable'] and not field['defaultedOnCreate']
+    return field['type'] not in ('double', 'date')
+
+def validate_value(field, value, action):
+    '''Given a field from SalesforceApi.fields() and a value
+       Return an error message STR, or None if value is valid
+
+       Values need not be STRs: programmatic callers may pass
+       unicode, bool, numbers, etc.  These are checked as text.
+    '''
+    ftype = field['type']
+    if value is None or value == '':
+        if required_field(field, action):
+            return '%s: Required field' % field['name']
+        return None
+
+    if isinstance(value, bool):
+        if ftype == 'boolean':
+            return None
+        value = str(value)
+    elif not isinstance(value, basestring):
+        value = unicode(value)
+
+    if ftype in ('id', 'reference'):
+        if not ID_REGEX.match(value):
+            return '%s: Invalid Id: %s' % (field['name'], value)
+    elif ftype in NUMERIC_TYPES:
+        try:
+            float(value)
+        except ValueError:
+            return '%s: Not a number: %s' % (field['name'], value)
+    elif ftype == 'int':
+        try:
+            int(value)
+        except ValueError:
+            return '%s: Not an integer: %s' % (field['name'], value)
+    elif ftype == 'boolean':
+        if value.lower() not in ('true', 'false', '1', '0'):
+            return '%s: Not a boolean: %s' % (field['name'], value)
+    elif ftype in ('date', 'datetime'):
+        try:
+            dateparse(value)
+        except (ValueError, OverflowError):
+            return '%s: Invalid %s: %s' % (field['name'], ftype, value)
+
+    if ftype in TEXT_TYPES and field['length']:
+        if isinstance(value, unicode):
+            length = len(value)
+        else:
+            length = len(unicode(value, errors='ignore'))
+        if length > field['length']:
+            return '%s: Length %s exceeds %s' % (field['name'], length,
+                                                 field['length'])
+
+    if ftype in ('picklist', 'multipicklist') and field['restrictedPicklist']:
+        values = value.split(';') if ftype == 'multipicklist' else [value]
+        bad = [v for v in values if v not in field['picklistValues']]
+        if bad:
+            return '%s: Invalid picklist value: %s' % (field['name'],
+                                                       ';'.join(bad))
+    return None
+
+def validate_chunk(args):
+    '''Given a tuple: (columns, rows, action)
+          where columns is an ARRAY of fields from SalesforceApi.fields(),
+          one per row value, or None for values not to check
+       Return a tuple: (valid rows, rejected rows with failure message)
+
+       Module level so it can be run by multiprocessing
+    '''
+    columns, rows, action = args
+    if action == 'delete':
+        columns = columns[:1]
+    valid = []
+    rejects = []
+    for row in rows:
+        errors = []
+        for field, value in zip(columns, row):
+            if field is None:
+                continue
+            emsg = validate_value(field, value, action)
+            if emsg:
+                errors.append(emsg)
+        if errors:
+            rejects.append(row + ['. '.join(errors)])
+        else:
+            valid.append(row)
+    return valid, rejects
+
+def column_index(header, column, sfobject):
+    '''Return index of column in header, case insensitive'''
+    names = [h.lower() for h in header]
+    if column.lower() not in names:
+        raise SalesforceApiError("Missing column '%s' for Salesforce object: %s"
+                                 % (column, sfobject))
+    return names.index(column.lower())
+
 def past_tense_action_str(action):
     '''Given  STR 'create'
        Return STR 'Created'
@@ -488,7 +1154,10 @@ def syntax(emsg=None):
     print "   %s      query <querystring>"       % ws
     print "   %s      queryAll <querystring> # <-- Include logical deletions" % ws
     print "   %s      show objects"              % ws
+    print "   %s      tree <object> <csvfile> " \
+          "<childobject>[.<relationship>]:<csvfile> ..." % ws
     print "   %s      update <object> <csvfile>" % ws
+    print "   %s      validate [create|update|delete] <object> <csvfile>" % ws
     print
     sys.exit(1)
 
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+'''Benchmark SalesforceSession against a local stand-in server
+
+   Compares bytes on the wire and wall time for:
+      - write payloads (composite tree sized), with and without
+        gzip request bodies
+      - query pages, with and without gzip responses
+        (gzip responses are the requests default, shown for reference)
+      - many small requests, with and without keep-alive
+
+   Loopback is much faster than a real link, so the server
+   simulates a link of the given bandwidth by sleeping for the
+   time the bytes it reads and writes would take to transfer.
+'''
+
+import os
+import sys
+import gzip
+import json
+import time
+import threading
+from StringIO import StringIO
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+
+from salesforceapi import SalesforceSession, gzip_str
+
+DEFAULT_MBITS = 10
+NUM_WRITES = 20
+NUM_PAGES = 20
+NUM_SMALL = 200
+QUERY_PATH = '/services/data/v50.0/query/'
+TREE_PATH = '/services/data/v50.0/composite/tree/Account'
+
+def records(n):
+    '''Return a LIST of n Account like records'''
+    return [{'attributes': {'type': 'Account', 'referenceId': 'ref%s' % i},
+             'Name': 'Account %s' % i,
+             'BillingStreet': '%s Main Street' % i,
+             'BillingCity': 'Springfield',
+             'Description': 'Benchmark record number %s' % i}
+            for i in range(n)]
+
+QUERY_PAGE = json.dumps({'done': True, 'totalSize': 2000,
+                         'records': records(2000)})
+QUERY_PAGE_GZ = gzip_str(QUERY_PAGE)
+TREE_BODY = json.dumps({'records': records(200)})
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+class StandInHandler(BaseHTTPRequestHandler):
+    '''Local stand-in for the Salesforce REST API'''
+
+    protocol_version = 'HTTP/1.1'
+    wbufsize = -1  # one write per response, avoids Nagle stalls
+
+    def transfer(self, nbytes):
+        self.server.bytes += nbytes
+        time.sleep(nbytes * 8.0 / (self.server.mbits * 1000000))
+
+    def do_GET(self):
+        body = '{}'
+        encoding = None
+        if self.path.startswith(QUERY_PATH):
+            body = QUERY_PAGE
+            if 'gzip' in self.headers.get('Accept-Encoding', ''):
+                body = QUERY_PAGE_GZ
+                encoding = 'gzip'
+        self.transfer(len(body))
+        self.respond(body, encoding)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.transfer(len(body))
+        if self.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.GzipFile(fileobj=StringIO(body)).read()
+        json.loads(body)
+        self.respond('{"hasErrors": false, "results": []}')
+
+    def respond(self, body, encoding=None):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        if self.close_connection:
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def measure(server, func):
+    '''Return a tuple: (bytes transferred, seconds) of func()'''
+    server.bytes = 0
+    start = time.time()
+    func()
+    return server.bytes, time.time() - start
+
+def report(name, before, after):
+    print '%-36s %12s bytes %7.2fs' % (name + ' (before)', before[0],
+                                         before[1])
+    print '%-36s %12s bytes %7.2fs' % (name + ' (after)', after[0],
+                                         after[1])
+    print '%-36s %11.0f%% bytes %6.0f%% time' % (
+        '', 100.0 * (1 - float(after[0]) / before[0]),
+        100.0 * (1 - after[1] / before[1]))
+    print
+
+def main(mbits):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+    server.mbits = mbits
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    url = 'http://127.0.0.1:%s' % server.server_port
+
+    print 'Stand-in link: %s Mbit/s' % mbits
+    print
+
+    def writes(session):
+        for i in range(NUM_WRITES):
+            session.post(url + TREE_PATH, data=TREE_BODY)
+    report('%s tree writes of 200 records' % NUM_WRITES,
+           measure(server, lambda: writes(SalesforceSession(compress=False))),
+           measure(server, lambda: writes(SalesforceSession())))
+
+    def pages(session, accept_encoding):
+        for i in range(NUM_PAGES):
+            session.get(url + QUERY_PATH,
+                        headers={'Accept-Encoding': accept_encoding}).json()
+    report('%s query pages of 2000 records' % NUM_PAGES,
+           measure(server, lambda: pages(SalesforceSession(), 'identity')),
+           measure(server, lambda: pages(SalesforceSession(),
+                                         'gzip, deflate')))
+
+    def small(session):
+        for i in range(NUM_SMALL):
+            session.get(url + '/services/data/v50.0/')
+    report('%s small requests, keep-alive' % NUM_SMALL,
+           measure(server, lambda: small(SalesforceSession(keep_alive=False))),
+           measure(server, lambda: small(SalesforceSession())))
+
+    server.shutdown()
+    server.server_close()
+
+def syntax():
+    progname = os.path.basename(sys.argv[0])
+    print
+    print "  syntax: %s [mbits_per_second]  # default %s" % (progname,
+                                                          DEFAULT_MBITS)
+    print
+    sys.exit(1)
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2:
+        syntax()
+    try:
+        mbits = float(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_MBITS
+    except ValueError:
+        syntax()
+    main(mbits)
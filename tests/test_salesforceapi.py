@@ -4,9 +4,15 @@
 import os
 import unittest
 import sys
+import gzip
+import json
+import threading
+from StringIO import StringIO
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
 from datetime import datetime
 
-TEST_NAMES = ('All', 'SalesforceApi')
+TEST_NAMES = ('All', 'SalesforceApi', 'Validate', 'SalesforceSession',
+              'Tree')
 
 
 # Fixtures
@@ -59,6 +65,372 @@ class TestSalesforceApi(unittest.TestCase):
         self.assertEqual(results[0]['Name'], test_str)
         self.sf.delete('Topic', ['Id'], [[results[0]['Id']]])
 
+    def test_validate_rows(self):
+        valid, rejects = self.sf.validateRows('user',
+                                              ['Id', 'AboutMe'],
+                                              [[TEST_USER_ID, 'test'],
+                                               ['bad_id', 'test']])
+        self.assertEqual(valid, [[TEST_USER_ID, 'test']])
+        self.assertEqual(rejects[0][-1], 'Id: Invalid Id: bad_id')
+
+    def test_tree(self):
+        test_str = 'test_%s' % datetime.now()
+        self.sf.tree('Account', ['Ref', 'Name'], [['a1', test_str]],
+                     [('Contact', ['ParentRef', 'LastName'],
+                       [['a1', test_str]])])
+        soql = "select Id, AccountId from Contact where LastName = '%s'" \
+               % test_str
+        contacts = self.sf.query(soql, format='dict')
+        soql = "select Id from Account where Name = '%s'" % test_str
+        accounts = self.sf.query(soql, format='dict')
+        self.assertEqual(contacts[0]['AccountId'], accounts[0]['Id'])
+        self.sf.delete('Contact', ['Id'], [[contacts[0]['Id']]])
+        self.sf.delete('Account', ['Id'], [[accounts[0]['Id']]])
+
+class TestValidate(unittest.TestCase):
+    '''Test offline validation. No connection needed'''
+
+    def setUp(self):
+        def field(**kwargs):
+            f = {'type': 'string', 'length': 10, 'name': 'Name',
+                 'nillable': True, 'defaultedOnCreate': False,
+                 'createable': True, 'restrictedPicklist': False,
+                 'picklistValues': []}
+            f.update(kwargs)
+            return f
+        self.field = field
+
+    def test_non_str_values(self):
+        from salesforceapi import validate_value
+        self.assertEqual(validate_value(self.field(type='boolean'),
+                                        True, 'update'), None)
+        self.assertEqual(validate_value(self.field(type='textarea'),
+                                        u'caf\xe9', 'update'), None)
+        self.assertEqual(validate_value(self.field(type='double'),
+                                        1.5, 'update'), None)
+        self.assertEqual(validate_value(self.field(type='int'),
+                                        0, 'update'), None)
+        self.assertEqual(validate_value(self.field(type='reference'),
+                                        12345, 'update'),
+                         'Name: Invalid Id: 12345')
+        self.assertEqual(validate_value(self.field(type='string'),
+                                        u'\xe9' * 11, 'update'),
+                         'Name: Length 11 exceeds 10')
+
+    def test_required(self):
+        from salesforceapi import validate_value
+        required = self.field(nillable=False)
+        self.assertEqual(validate_value(required, '', 'create'),
+                         'Name: Required field')
+        self.assertEqual(validate_value(required, '', 'update'),
+                         'Name: Required field')
+        self.assertEqual(validate_value(self.field(type='double',
+                                                   nillable=False),
+                                        '', 'update'), None)
+
+    def test_validate_chunk(self):
+        from salesforceapi import validate_chunk
+        columns = [self.field(type='id', name='Id', nillable=False),
+                   self.field(type='picklist', name='Stage',
+                              restrictedPicklist=True,
+                              picklistValues=['Open', 'Closed']),
+                   None]
+        rows = [['0013000000AbCdE', 'Open', 'x'],
+                ['0013000000AbCdE', 'Lost', 'x']]
+        valid, rejects = validate_chunk((columns, rows, 'update'))
+        self.assertEqual(valid, rows[:1])
+        self.assertEqual(rejects[0][-1],
+                         'Stage: Invalid picklist value: Lost')
+
+    def test_parallel_rows(self):
+        import salesforceapi
+        sf = salesforceapi.SalesforceApi.__new__(salesforceapi.SalesforceApi)
+        sf._connection = FakeConnection()
+        rows = [['Name %s' % i if i % 7 else ''] for i in range(100)]
+        serial = sf.validateRows('Account', ['Name'], rows, 'create',
+                                 processes=1)
+        chunk_size = salesforceapi.VALIDATE_CHUNK_SIZE
+        salesforceapi.VALIDATE_CHUNK_SIZE = 10
+        try:
+            parallel = sf.validateRows('Account', ['Name'], rows, 'create',
+                                       processes=2)
+        finally:
+            salesforceapi.VALIDATE_CHUNK_SIZE = chunk_size
+        self.assertEqual(parallel, serial)
+        self.assertEqual(len(serial[1]), 15)
+
+class RecordingHandler(BaseHTTPRequestHandler):
+    '''Local stand-in for Salesforce. Records each request'''
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.server.requests.append((self.path, dict(self.headers), body))
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write('{}')
+
+    def log_message(self, *args):
+        pass
+
+class TestSalesforceSession(unittest.TestCase):
+    '''Test HTTP session against a local server. No connection needed'''
+
+    def setUp(self):
+        self.server = HTTPServer(('127.0.0.1', 0), RecordingHandler)
+        self.server.requests = []
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.url = 'http://127.0.0.1:%s' % self.server.server_port
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def post(self, path, data, **kwargs):
+        from salesforceapi import SalesforceSession
+        SalesforceSession(**kwargs).post(self.url + path, data=data)
+        return self.server.requests[-1]
+
+    def test_gzip_round_trip(self):
+        from salesforceapi import gzip_str
+        data = u'{"Name": "caf\xe9"}' * 100
+        unzipped = gzip.GzipFile(fileobj=StringIO(gzip_str(data))).read()
+        self.assertEqual(unzipped.decode('utf-8'), data)
+
+    def test_compress_rest_body(self):
+        data = '{"Name": "test"}' * 100
+        path, headers, body = self.post('/services/data/v50.0/sobjects/',
+                                        data, compress_min_size=1024)
+        self.assertEqual(headers.get('content-encoding'), 'gzip')
+        self.assertEqual(gzip.GzipFile(fileobj=StringIO(body)).read(), data)
+
+    def test_small_body_not_compressed(self):
+        path, headers, body = self.post('/services/data/v50.0/sobjects/',
+                                        '{}', compress_min_size=1024)
+        self.assertEqual(headers.get('content-encoding'), None)
+        self.assertEqual(body, '{}')
+
+    def test_soap_login_not_compressed(self):
+        data = '<soapenv:Envelope/>' * 100
+        path, headers, body = self.post('/services/Soap/u/50.0', data,
+                                        compress_min_size=0)
+        self.assertEqual(headers.get('content-encoding'), None)
+        self.assertEqual(body, data)
+
+    def test_compress_off(self):
+        data = '{"Name": "test"}' * 100
+        path, headers, body = self.post('/services/data/v50.0/sobjects/',
+                                        data, compress=False)
+        self.assertEqual(headers.get('content-encoding'), None)
+
+    def test_timeout_default(self):
+        from salesforceapi import SalesforceSession, HTTP_DEFAULTS
+        self.assertEqual(SalesforceSession().timeout,
+                         HTTP_DEFAULTS['timeout'])
+        self.assertEqual(SalesforceSession(timeout=5).timeout, 5)
+
+def describe_field(name, type='string', **kwargs):
+    field = {'name': name, 'type': type, 'length': 80, 'nillable': True,
+             'createable': True, 'defaultedOnCreate': False,
+             'restrictedPicklist': False, 'picklistValues': []}
+    field.update(kwargs)
+    return field
+
+DESCRIBE = {
+    'Account': {
+        'fields': [describe_field('Id', 'id', length=18, nillable=False,
+                                  createable=False),
+                   describe_field('Name', nillable=False),
+                   describe_field('ParentId', 'reference', length=18)],
+        'childRelationships': [
+            {'childSObject': 'Contact', 'relationshipName': 'Contacts',
+             'field': 'AccountId'},
+            {'childSObject': 'Account', 'relationshipName': 'ChildAccounts',
+             'field': 'ParentId'},
+            {'childSObject': 'Task', 'relationshipName': None,
+             'field': 'AccountId'},
+            {'childSObject': 'Book__c', 'relationshipName': 'Books',
+             'field': 'Account__c'},
+            {'childSObject': 'Book__c', 'relationshipName': 'Publishers',
+             'field': 'Publisher__c'}]},
+    'Contact': {
+        'fields': [describe_field('Id', 'id', length=18, nillable=False,
+                                  createable=False),
+                   describe_field('LastName', nillable=False),
+                   describe_field('AccountId', 'reference', length=18,
+                                  nillable=False)],
+        'childRelationships': []},
+    'Book__c': {
+        'fields': [describe_field('Id', 'id', length=18, nillable=False,
+                                  createable=False),
+                   describe_field('Name'),
+                   describe_field('Account__c', 'reference', length=18),
+                   describe_field('Publisher__c', 'reference', length=18)],
+        'childRelationships': []},
+}
+
+class FakeTreeError(Exception):
+    '''Like simple_salesforce SalesforceMalformedRequest'''
+    def __init__(self, content):
+        Exception.__init__(self, 'Malformed request')
+        self.content = content
+
+class FakeSObject(object):
+    def __init__(self, name):
+        self.name = name
+    def describe(self):
+        return DESCRIBE[self.name]
+
+class FakeConnection(object):
+    '''Stand-in for simple_salesforce.Salesforce.
+       Records named 'Bad' fail, failing the whole request
+    '''
+    def __init__(self):
+        self.requests = []
+        self.num_ids = 0
+
+    def __getattr__(self, name):
+        return FakeSObject(name)
+
+    def restful(self, path, method='GET', data=None):
+        body = json.loads(data)
+        self.requests.append((path, body))
+        results = []
+        errors = []
+        def walk(records):
+            for record in records:
+                ref = record['attributes']['referenceId']
+                if 'Bad' in (record.get('Name'), record.get('LastName')):
+                    errors.append({'referenceId': ref,
+                                   'errors': [{'message': 'Bad record'}]})
+                self.num_ids += 1
+                results.append({'referenceId': ref,
+                                'id': 'ID%013d' % self.num_ids})
+                for value in record.values():
+                    if isinstance(value, dict) and 'records' in value:
+                        walk(value['records'])
+        walk(body['records'])
+        if errors:
+            raise FakeTreeError({'hasErrors': True, 'results': errors})
+        return {'hasErrors': False, 'results': results}
+
+def num_records(records):
+    return sum([1 + sum([num_records(v['records']) for v in r.values()
+                         if isinstance(v, dict) and 'records' in v])
+                for r in records])
+
+class TestTree(unittest.TestCase):
+    '''Test tree() against a fake connection. No connection needed'''
+
+    def setUp(self):
+        from salesforceapi import SalesforceApi
+        self.sf = SalesforceApi.__new__(SalesforceApi)
+        self.sf.verbose = 0
+        self.sf._connection = FakeConnection()
+        self.output = {}
+        def writeOutput(key, header, successes, failures, columns=None):
+            self.output[key] = (successes, failures)
+            return []
+        self.sf.writeOutput = writeOutput
+
+    def tree(self, parents, children, child_sfobject='Contact',
+             relationship=None):
+        child_header = ['ParentRef', 'LastName']
+        if child_sfobject != 'Contact':
+            child_header = ['ParentRef', 'Name']
+        self.sf.tree('Account', ['Ref', 'Name'], parents,
+                     [(child_sfobject, child_header, children,
+                       relationship)])
+
+    def test_ids(self):
+        self.tree([['a1', 'One'], ['a2', 'Two']],
+                  [['a1', 'Smith'], ['a2', 'Jones']])
+        accounts, failures = self.output['Account']
+        contacts, failures = self.output['Contact']
+        self.assertEqual(accounts[0], ['a1', 'One', 'ID0000000000001',
+                                       'Created'])
+        self.assertEqual(contacts[0], ['a1', 'Smith', 'ID0000000000002',
+                                       'ID0000000000001', 'Created'])
+        self.assertEqual(contacts[1], ['a2', 'Jones', 'ID0000000000004',
+                                       'ID0000000000003', 'Created'])
+
+    def test_batching(self):
+        from salesforceapi import TREE_MAX_NODES
+        parents = [['a%s' % i, 'Account %s' % i] for i in range(150)]
+        children = [['a%s' % i, 'Contact %s' % i] for i in range(150)]
+        self.tree(parents, children)
+        requests = self.sf._connection.requests
+        self.assertEqual([num_records(b['records']) for p, b in requests],
+                         [TREE_MAX_NODES, 100])
+        self.assertEqual(requests[0][0], 'composite/tree/Account')
+        self.assertEqual(len(self.output['Contact'][0]), 150)
+
+    def test_over_limit(self):
+        children = [['big', 'Contact %s' % i] for i in range(200)]
+        self.tree([['big', 'Big'], ['a1', 'Small']],
+                  children + [['a1', 'Smith']])
+        self.assertEqual(len(self.sf._connection.requests), 1)
+        self.assertEqual(self.output['Account'][1][0][-1],
+                         'Tree of 201 records exceeds limit of 200')
+        self.assertEqual(len(self.output['Contact'][1]), 200)
+        self.assertEqual(len(self.output['Contact'][0]), 1)
+
+    def test_rollback(self):
+        self.tree([['a1', 'One'], ['a2', 'Two']],
+                  [['a1', 'Smith'], ['a2', 'Bad']])
+        accounts, account_failures = self.output['Account']
+        contacts, contact_failures = self.output['Contact']
+        self.assertEqual(accounts + contacts, [])
+        self.assertEqual([r[-1] for r in account_failures],
+                         ['Rolled back', 'Rolled back'])
+        self.assertEqual([r[-1] for r in contact_failures],
+                         ['Rolled back', 'Bad record'])
+
+    def test_duplicate_ref(self):
+        from salesforceapi import SalesforceApiError
+        self.assertRaises(SalesforceApiError, self.tree,
+                          [['a1', ''], ['a1', 'Good']], [['a1', 'Smith']])
+        self.assertEqual(self.sf._connection.requests, [])
+
+    def test_blank_refs(self):
+        self.tree([['', 'No Ref'], ['a1', 'One']],
+                  [['', 'Orphan'], ['a1', 'Smith']])
+        accounts, account_failures = self.output['Account']
+        contacts, contact_failures = self.output['Contact']
+        self.assertEqual(account_failures, [['', 'No Ref', 'Missing Ref']])
+        self.assertEqual(contact_failures,
+                         [['', 'Orphan', 'Missing ParentRef']])
+        self.assertEqual([r[1] for r in contacts], ['Smith'])
+
+    def test_rejected_parent(self):
+        self.tree([['a1', ''], ['a2', 'Two']],
+                  [['a1', 'Smith'], ['a2', 'Jones']])
+        contacts, contact_failures = self.output['Contact']
+        self.assertEqual(self.output['Account'][1][0][-1],
+                         'Name: Required field')
+        self.assertEqual(contact_failures,
+                         [['a1', 'Smith', 'Parent rejected: a1']])
+        self.assertEqual([r[1] for r in contacts], ['Jones'])
+
+    def test_relationships(self):
+        from salesforceapi import SalesforceApiError
+        self.assertRaises(SalesforceApiError, self.tree,
+                          [['a1', 'One']], [['a1', 'Book']], 'Book__c')
+        self.assertRaises(SalesforceApiError, self.tree,
+                          [['a1', 'One']], [['a1', 'Book']], 'Task')
+        self.tree([['a1', 'One']], [['a1', 'Book']], 'Book__c', 'Books')
+        path, body = self.sf._connection.requests[-1]
+        self.assertEqual(body['records'][0]['Books']['records'][0]['Name'],
+                         'Book')
+
+    def test_self_relationship(self):
+        self.tree([['a1', 'One']], [['a1', 'Child']], 'Account')
+        self.assertEqual(len(self.output['Account'][0]), 1)
+        child = self.output['Account.ChildAccounts'][0][0]
+        self.assertEqual(child[-2], 'ID0000000000001')
+
 def syntax():
     progname = os.path.basename(sys.argv[0])
     print